@@ -1,10 +1,30 @@
 import bpy
 import bmesh
+import numpy as np
+from itertools import chain
+from bpy.app.handlers import persistent
 from bpy.types import Panel, Operator, PropertyGroup
-from mathutils import Matrix, Vector
 from mathutils.bvhtree import BVHTree
 from mathutils.kdtree import KDTree
 
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # SciPy is not bundled with every Blender build
+    cKDTree = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Optional; the NumPy path is used without it
+    njit = None
+
+# Target tree cache: obj.as_pointer() -> (stamp, tree, tree-space coords)
+_TREE_CACHE = {}
+# Below this many points a threaded query costs more than it saves
+_PARALLEL_QUERY_MIN = 512
+
+# Source topology cache: obj.as_pointer() -> (stamp, indptr, indices)
+_ADJACENCY_CACHE = {}
+
 bl_info = {
     "name": "Match Crawl (Rigid Transport)",
     "author": "Robert Rioux",
@@ -24,43 +44,38 @@ class MatchProps(PropertyGroup):
     source_seeds: bpy.props.CollectionProperty(type=bpy.types.PropertyGroup)
     target_seeds: bpy.props.CollectionProperty(type=bpy.types.PropertyGroup)
 
-    frontier: bpy.props.CollectionProperty(type=bpy.types.PropertyGroup)
-    matched: bpy.props.CollectionProperty(type=bpy.types.PropertyGroup)
-
     initialized: bpy.props.BoolProperty(default=False)
+    # Matches farther than this (world units) are treated as drift and rejected
+    max_dist: bpy.props.FloatProperty(default=0.0)
 
-    R: bpy.props.FloatVectorProperty(size=9)
-    T: bpy.props.FloatVectorProperty(size=3)
+    # Binary state lives in raw-bytes ID properties:
+    #   "_matched" / "_frontier": np.packbits per-vertex bitsets
+    #   "_rt_affine": seed transform [R | T] as float32 (3, 4)
+    def get_mask(self, key, size):
+        buf = np.frombuffer(self.get(key, b""), dtype=np.uint8)
+        return np.unpackbits(buf, count=size).astype(np.bool_)
 
-    def _get(self, col):
-        return {int(p.name) for p in col}
-
-    def _set(self, col, values):
-        col.clear()
-        for v in values:
-            col.add().name = str(int(v))
+    def set_mask(self, key, mask):
+        self[key] = np.packbits(mask).tobytes()
 
     def set_RT(self, R, T):
-        self.R = [R[i][j] for i in range(3) for j in range(3)]
-        self.T = [T.x, T.y, T.z]
-
-    def get_R(self):
-        r = self.R
-        return Matrix(((r[0], r[1], r[2]),
-                       (r[3], r[4], r[5]),
-                       (r[6], r[7], r[8])))
+        self["_rt_affine"] = np.column_stack((R, T)).astype(np.float32).tobytes()
 
-    def get_T(self):
-        return Vector(self.T)
+    def get_affine(self):
+        return np.frombuffer(self["_rt_affine"], dtype=np.float32).reshape(3, 4)
 
     def reset(self):
+        if self.source_obj is not None:
+            _ADJACENCY_CACHE.pop(self.source_obj.as_pointer(), None)
         self.source_obj = None
         self.target_obj = None
         self.source_seeds.clear()
         self.target_seeds.clear()
-        self.frontier.clear()
-        self.matched.clear()
         self.initialized = False
+        self.max_dist = 0.0
+        for key in ("_matched", "_frontier", "_rt_affine"):
+            if key in self:
+                del self[key]
 
 # ============================================================
 # Helpers
@@ -78,37 +93,198 @@ def ordered_selected_verts(context):
             out.append(e.index)
     return obj, out
 
-def select_only(bm, indices):
-    for v in bm.verts:
+def select_only(bm, verts, indices, previous=None):
+    # previous: what the last crawl step selected, so only those need clearing;
+    # None clears every vertex. Stays on this BMesh, leaving the target alone.
+    for v in (verts if previous is None else (verts[i] for i in previous)):
         v.select = False
+    bm.select_flush(False)
     for i in indices:
-        bm.verts[i].select = True
+        verts[i].select = True
+    bm.select_flush(True)
 
-def build_kdtree(context, obj):
-    deps = context.evaluated_depsgraph_get()
-    eval_obj = obj.evaluated_get(deps)
-    mesh = eval_obj.to_mesh()
+def apply_matrix(M, points):
+    # M is a 4x4 (or 3x4) affine as ndarray, points an (N, 3) array
+    return points @ M[:3, :3].T + M[:3, 3]
+
+def mesh_coords(mesh):
     size = len(mesh.vertices)
-    if size == 0:
+    flat = np.empty(size * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', flat)
+    return flat.reshape(size, 3).astype(np.float64)
+
+def bm_coords(verts):
+    # BMesh has no foreach_get; stream the floats straight into one buffer
+    flat = np.fromiter(chain.from_iterable(v.co for v in verts), dtype=np.float64, count=len(verts) * 3)
+    return flat.reshape(-1, 3)
+
+def similarity_scale(M):
+    # Scale factor of an affine that is rotation + uniform scale, else None
+    A = M[:3, :3]
+    G = A.T @ A
+    s2 = np.trace(G) / 3.0
+    if s2 <= 0.0 or not np.allclose(G, s2 * np.eye(3), rtol=0.0, atol=1e-6 * s2):
         return None
-    kd = KDTree(size)
-    for i, v in enumerate(mesh.vertices):
-        kd.insert(eval_obj.matrix_world @ v.co, i)
+    return float(np.sqrt(s2))
+
+def build_kdtree(context, obj, matrix=None):
+    # Without modifiers or shape keys the base mesh already is the evaluated one
+    # (unless it is in edit mode, where obj.data lags behind the edit mesh)
+    owns = (obj.type != 'MESH' or obj.mode == 'EDIT' or bool(obj.modifiers)
+            or obj.data.shape_keys is not None)
+    if owns:
+        deps = context.evaluated_depsgraph_get()
+        eval_obj = obj.evaluated_get(deps)
+        mesh = eval_obj.to_mesh()
+    else:
+        mesh = obj.data
+    # Local space unless a matrix is given (needed when local distances
+    # don't match world distances)
+    coords = mesh_coords(mesh)
+    if matrix is not None:
+        coords = apply_matrix(matrix, coords)
+    if owns:
+        eval_obj.to_mesh_clear()
+    if len(coords) == 0:
+        return None, coords
+    if cKDTree is not None:
+        return cKDTree(coords), coords
+    kd = KDTree(len(coords))
+    for i, co in enumerate(coords.tolist()):
+        kd.insert(co, i)
     kd.balance()
-    eval_obj.to_mesh_clear()
-    return kd
+    return kd, coords
+
+def _tree_stamp(obj, matrix):
+    return len(obj.data.vertices), None if matrix is None else matrix.tobytes()
+
+def _get_or_build_tree(context, obj, matrix=None):
+    key = obj.as_pointer()
+    stamp = _tree_stamp(obj, matrix)
+    cached = _TREE_CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2]
+    tree, coords = build_kdtree(context, obj, matrix)
+    if tree is not None:
+        _TREE_CACHE[key] = (stamp, tree, coords)
+    return tree, coords
+
+@persistent
+def _invalidate_tree_cache(scene, depsgraph):
+    for update in depsgraph.updates:
+        if update.is_updated_geometry and isinstance(update.id, bpy.types.Object):
+            _TREE_CACHE.pop(update.id.original.as_pointer(), None)
+
+@persistent
+def _clear_caches(*_args):
+    # A loaded or reverted file can reuse the old pointers and vertex counts
+    _TREE_CACHE.clear()
+    _ADJACENCY_CACHE.clear()
+
+@persistent
+def _on_undo_redo(*_args):
+    # Undo can restore a different topology with the same element counts
+    _ADJACENCY_CACHE.clear()
+    # Edit-mesh undo restores the vertices but not match_props, so the saved
+    # frontier no longer matches the mesh; the next Crawl re-seeds instead
+    for scene in bpy.data.scenes:
+        p = getattr(scene, "match_props", None)
+        if p is not None and p.initialized:
+            p.initialized = False
+
+def read_edges(mesh):
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    return edges.reshape(-1, 2)
+
+def build_adjacency(n_verts, edges):
+    # CSR vertex adjacency: neighbours of v are indices[indptr[v]:indptr[v + 1]]
+    rows = np.concatenate((edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_verts + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_verts), out=indptr[1:])
+    return indptr, cols[order]
+
+def median_edge_length(co, a, b):
+    # co: (N, 3) coordinates, a/b: endpoint indices of each edge
+    if not len(a):
+        return np.inf
+    return float(np.median(np.linalg.norm(co[a] - co[b], axis=1)))
+
+def bm_edges(bm):
+    # Read from the edit BMesh itself; obj.data lags behind until flushed
+    flat = np.fromiter(chain.from_iterable((e.verts[0].index, e.verts[1].index) for e in bm.edges),
+                       dtype=np.int32, count=len(bm.edges) * 2)
+    return flat.reshape(-1, 2)
+
+def _get_or_build_adjacency(obj, bm):
+    # Entries are dropped on reseed, reset, undo/redo and file load
+    key = obj.as_pointer()
+    stamp = (len(bm.verts), len(bm.edges))
+    cached = _ADJACENCY_CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2]
+    indptr, indices = build_adjacency(len(bm.verts), bm_edges(bm))
+    _ADJACENCY_CACHE[key] = (stamp, indptr, indices)
+    return indptr, indices
+
+def ring_neighbors(indptr, indices, rows):
+    # Concatenated neighbour lists of all rows, gathered without a Python loop
+    rows = np.asarray(rows, dtype=np.intp)
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return indices[offsets + np.arange(counts.sum())]
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _next_ring_jit(indptr, indices, front_idx, matched, frontier):
+        out = np.zeros(matched.shape[0], dtype=np.bool_)
+        for k in prange(front_idx.shape[0]):
+            v = front_idx[k]
+            for j in range(indptr[v], indptr[v + 1]):
+                n = indices[j]
+                if not matched[n] and not frontier[n]:
+                    out[n] = True
+        return out
+else:
+    _next_ring_jit = None
+
+def next_ring(indptr, indices, front_idx, matched, frontier):
+    # Bitset of unvisited neighbours of front_idx
+    if _next_ring_jit is not None:
+        return _next_ring_jit(indptr, indices, front_idx, matched, frontier)
+    nbrs = ring_neighbors(indptr, indices, front_idx)
+    nbrs = nbrs[~matched[nbrs] & ~frontier[nbrs]]
+    out = np.zeros(matched.shape[0], dtype=np.bool_)
+    out[nbrs] = True
+    return out
+
+def query_nearest(tree, points, max_dist=np.inf):
+    # Returns (distances, indices); misses beyond max_dist get an inf distance
+    if cKDTree is not None:
+        workers = -1 if len(points) >= _PARALLEL_QUERY_MIN else 1
+        return tree.query(points, k=1, distance_upper_bound=max_dist, workers=workers)
+    hits = [tree.find(co) for co in points.tolist()]
+    dist = np.array([h[2] if h[2] <= max_dist else np.inf for h in hits], dtype=np.float64)
+    idx = np.array([h[1] for h in hits], dtype=np.intp)
+    return dist, idx
 
 def rigid_from_3(src, tgt):
+    # src, tgt: (3, 3) arrays, one point per row
     def frame(a, b, c):
-        x = (b - a).normalized()
-        z = x.cross(c - a).normalized()
-        y = z.cross(x).normalized()
-        return Matrix((x, y, z)).transposed(), a
+        x = (b - a) / np.linalg.norm(b - a)
+        z = np.cross(x, c - a)
+        z /= np.linalg.norm(z)
+        y = np.cross(z, x)
+        return np.column_stack((x, y, z)), a
 
     R1, T1 = frame(*src)
     R2, T2 = frame(*tgt)
 
-    R = R2 @ R1.inverted()
+    # R1 is orthonormal, so its inverse is its transpose
+    R = R2 @ R1.T
     T = T2 - R @ T1
     return R, T
 
@@ -127,6 +303,7 @@ class MATCH_OT_SetSourceSeeds(Operator):
 
         p = context.scene.match_props
         p.reset()
+        _ADJACENCY_CACHE.pop(obj.as_pointer(), None)
         p.source_obj = obj
         for v in verts:
             p.source_seeds.add().name = str(v)
@@ -154,6 +331,10 @@ class MATCH_OT_SetTargetSeeds(Operator):
 class MATCH_OT_Crawl(Operator):
     bl_idname = "match.crawl"
     bl_label = "Crawl"
+    # Each click still pushes an edit-mesh undo step; grouping only merges
+    # consecutive crawls into one entry in the undo history
+    bl_options = {'REGISTER', 'UNDO_GROUPED'}
+    bl_undo_group = "match.crawl"
 
     def execute(self, context):
         p = context.scene.match_props
@@ -166,6 +347,7 @@ class MATCH_OT_Crawl(Operator):
 
         bm = bmesh.from_edit_mesh(src.data)
         bm.verts.ensure_lookup_table()
+        verts = list(bm.verts)
 
         src_mw = src.matrix_world
         src_inv = src_mw.inverted()
@@ -173,65 +355,112 @@ class MATCH_OT_Crawl(Operator):
 
         # ---------- INIT ----------
         if not p.initialized:
-            src_pts = [src_mw @ bm.verts[int(s.name)].co for s in p.source_seeds]
-            tgt_pts = [tgt_mw @ tgt.data.vertices[int(s.name)].co for s in p.target_seeds]
+            src_idx = [int(s.name) for s in p.source_seeds]
+            tgt_idx = [int(s.name) for s in p.target_seeds]
+            src_pts = apply_matrix(np.array(src_mw), bm_coords([verts[i] for i in src_idx]))
+            tgt_pts = apply_matrix(np.array(tgt_mw), np.array([tgt.data.vertices[i].co for i in tgt_idx]))
 
             R, T = rigid_from_3(src_pts, tgt_pts)
             p.set_RT(R, T)
 
-            matched = set()
-            frontier = set()
+            # Every CSR edge appears twice, which leaves the median as is
+            indptr, indices = _get_or_build_adjacency(src, bm)
+            src_co = apply_matrix(np.array(src_mw), bm_coords(verts))
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            src_median = median_edge_length(src_co, rows, indices)
+
+            # A coarser target can put correct hits well past the source's edge length
+            tgt_edges = read_edges(tgt.data)
+            tgt_world = apply_matrix(np.array(tgt_mw), mesh_coords(tgt.data))
+            tgt_median = median_edge_length(tgt_world, tgt_edges[:, 0], tgt_edges[:, 1])
+            p.max_dist = 4.0 * max(src_median, tgt_median)
 
-            for s, t in zip(p.source_seeds, p.target_seeds):
-                si = int(s.name)
-                ti = int(t.name)
-                bm.verts[si].co = src_inv @ (tgt_mw @ tgt.data.vertices[ti].co)
-                matched.add(si)
+            matched = np.zeros(len(verts), dtype=np.bool_)
 
-            for i in matched:
-                for e in bm.verts[i].link_edges:
-                    frontier.add(e.other_vert(bm.verts[i]).index)
+            # tgt_pts already holds the seeds in world space
+            for si, co in zip(src_idx, apply_matrix(np.array(src_inv), tgt_pts).tolist()):
+                verts[si].co = co
+                matched[si] = True
 
-            p._set(p.matched, matched)
-            p._set(p.frontier, frontier)
+            seeds = np.asarray(src_idx, dtype=np.intp)
+            frontier = next_ring(indptr, indices, seeds, matched, np.zeros_like(matched))
+
+            p.set_mask("_matched", matched)
+            p.set_mask("_frontier", frontier)
             p.initialized = True
 
+            select_only(bm, verts, np.flatnonzero(frontier).tolist())
             bmesh.update_edit_mesh(src.data)
-            select_only(bm, frontier)
             return {'FINISHED'}
 
         # ---------- CRAWL ----------
-        R = p.get_R()
-        T = p.get_T()
-        kdtree = build_kdtree(context, tgt)
+        # Sessions saved before the packed transform / drift cutoff lack them
+        if "_rt_affine" not in p or p.max_dist <= 0.0:
+            self.report({'ERROR'}, "Crawl state is incomplete, set the seeds again.")
+            return {'CANCELLED'}
+
+        A = p.get_affine()
+        R, T = A[:, :3], A[:, 3]
+
+        # Rotation + uniform scale keep nearest neighbours and scale distances
+        # evenly, so those targets are searched in local space. Any other
+        # transform (non-uniform scale, shear) uses a world-space tree.
+        G = np.array(tgt_mw)
+        tgt_scale = similarity_scale(G)
+        kdtree, tgt_co = _get_or_build_tree(context, tgt, None if tgt_scale is not None else G)
 
         if kdtree is None:
             self.report({'ERROR'}, "Target mesh has no vertices.")
             return {'CANCELLED'}
 
-        frontier = p._get(p.frontier)
-        matched = p._get(p.matched)
-        next_frontier = set()
+        frontier = p.get_mask("_frontier", len(verts))
+        matched = p.get_mask("_matched", len(verts))
 
-        for i in frontier:
-            v = bm.verts[i]
-            guess = R @ (src_mw @ v.co) + T
-            hit = kdtree.find(guess)
-            if hit:
-                co, index, dist = hit
-                v.co = src_inv @ co
-
-            for e in v.link_edges:
-                j = e.other_vert(v).index
-                if j not in matched and j not in frontier:
-                    next_frontier.add(j)
-
-        matched |= frontier
-        p._set(p.matched, matched)
-        p._set(p.frontier, next_frontier)
+        front_idx = np.flatnonzero(frontier)
+        if not front_idx.size:
+            self.report({'INFO'}, "Nothing left to crawl.")
+            return {'FINISHED'}
 
+        front_verts = [verts[i] for i in front_idx.tolist()]
+        coords = bm_coords(front_verts)
+
+        # Fold [R | T] @ src_mw (and tgt_inv, for a local tree) into one affine,
+        # then one batched query; W maps the hits back to source-local
+        RT = np.eye(4)
+        RT[:3, :3] = R
+        RT[:3, 3] = T
+        M = RT @ np.array(src_mw)
+        W = np.array(src_inv)
+        max_dist = p.max_dist
+        if tgt_scale is not None:
+            M = np.linalg.inv(G) @ M
+            W = W @ G
+            max_dist /= tgt_scale
+
+        guesses = apply_matrix(M, coords)
+        dist, hit = query_nearest(kdtree, guesses, max_dist)
+        ok = np.isfinite(dist)
+        found = apply_matrix(W, tgt_co[hit[ok]])
+
+        hit_verts = [v for v, keep in zip(front_verts, ok.tolist()) if keep]
+        for v, co in zip(hit_verts, found.tolist()):
+            v.co = co
+
+        # Rejected vertices stay where they are but are still crawled through,
+        # so a whole rejected ring or a hole in the target doesn't stall the crawl
+        indptr, indices = _get_or_build_adjacency(src, bm)
+        next_frontier = next_ring(indptr, indices, front_idx, matched, frontier)
+
+        matched[front_idx] = True
+        p.set_mask("_matched", matched)
+        p.set_mask("_frontier", next_frontier)
+
+        select_only(bm, verts, np.flatnonzero(next_frontier).tolist(), front_idx.tolist())
         bmesh.update_edit_mesh(src.data)
-        select_only(bm, next_frontier)
+
+        rejected = int(len(ok) - ok.sum())
+        if rejected:
+            self.report({'WARNING'}, f"{rejected} vertices had no target match in range and were left in place.")
         return {'FINISHED'}
 
 class MATCH_OT_Reset(Operator):
@@ -275,8 +504,20 @@ def register():
     for c in classes:
         bpy.utils.register_class(c)
     bpy.types.Scene.match_props = bpy.props.PointerProperty(type=MatchProps)
+    bpy.app.handlers.depsgraph_update_post.append(_invalidate_tree_cache)
+    bpy.app.handlers.load_post.append(_clear_caches)
+    bpy.app.handlers.undo_post.append(_on_undo_redo)
+    bpy.app.handlers.redo_post.append(_on_undo_redo)
 
 def unregister():
+    if _invalidate_tree_cache in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_invalidate_tree_cache)
+    if _clear_caches in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_clear_caches)
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _on_undo_redo in handlers:
+            handlers.remove(_on_undo_redo)
+    _clear_caches()
     del bpy.types.Scene.match_props
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
@@ -10,6 +10,8 @@ bl_info = {
 
 import bpy
 import bmesh
+import numpy as np
+from itertools import chain
 from bpy.types import Panel, Operator, PropertyGroup
 from bpy.props import CollectionProperty, PointerProperty, IntProperty
 
@@ -38,48 +40,61 @@ def get_selected_verts(obj):
     bm.verts.ensure_lookup_table()
     return [v.index for v in bm.verts if v.select]
 
-def get_neighbors(bm, index):
-    bm.verts.ensure_lookup_table()
-    return set(e.other_vert(bm.verts[index]).index for e in bm.verts[index].link_edges)
-
-def crawl_one_ring(obj, visited_set):
-    bm = bmesh.from_edit_mesh(obj.data)
-    bm.verts.ensure_lookup_table()
-    next_ring = set()
-    for i in visited_set:
-        next_ring.update(get_neighbors(bm, i))
-    return sorted(list(next_ring - visited_set))
-
-def select_vertices(obj, indices):
-    bpy.ops.object.mode_set(mode='EDIT')
-    bm = bmesh.from_edit_mesh(obj.data)
-    bm.verts.ensure_lookup_table()
-    for v in bm.verts:
-        v.select = v.index in indices
-    bmesh.update_edit_mesh(obj.data)
-
-def move_verts_to_match(src_obj, tgt_obj, src_indices, tgt_indices):
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    src_bm = bmesh.new()
-    src_bm.from_mesh(src_obj.data)
-    src_bm.verts.ensure_lookup_table()
-
-    tgt_bm = bmesh.new()
-    tgt_bm.from_mesh(tgt_obj.data)
-    tgt_bm.verts.ensure_lookup_table()
-
-    inv_mat = src_obj.matrix_world.inverted()
-    for s_idx, t_idx in zip(src_indices, tgt_indices):
-        if s_idx < len(src_bm.verts) and t_idx < len(tgt_bm.verts):
-            sw = tgt_obj.matrix_world @ tgt_bm.verts[t_idx].co
-            src_bm.verts[s_idx].co = inv_mat @ sw
-
-    src_bm.to_mesh(src_obj.data)
-    src_bm.free()
-    tgt_bm.free()
-
-    bpy.ops.object.mode_set(mode='EDIT')
+def build_adjacency(bm):
+    # CSR vertex adjacency: neighbours of v are indices[indptr[v]:indptr[v + 1]].
+    # One pass over bm.edges per operator call, instead of link_edges per ring.
+    n_verts = len(bm.verts)
+    edges = np.fromiter(chain.from_iterable((e.verts[0].index, e.verts[1].index) for e in bm.edges),
+                        dtype=np.int32, count=len(bm.edges) * 2).reshape(-1, 2)
+    rows = np.concatenate((edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_verts + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_verts), out=indptr[1:])
+    return indptr, cols[order]
+
+def index_mask(size, indices):
+    mask = np.zeros(size, dtype=np.bool_)
+    idx = np.asarray(indices, dtype=np.intp)
+    mask[idx[idx < size]] = True
+    return mask
+
+def crawl_one_ring(adjacency, ring, visited):
+    # Sorted unvisited neighbours of ring; visited is a per-vertex bool mask
+    indptr, indices = adjacency
+    rows = np.asarray(ring, dtype=np.intp)
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    nbrs = indices[offsets + np.arange(counts.sum())]
+    new = np.zeros_like(visited)
+    new[nbrs[~visited[nbrs]]] = True
+    return np.flatnonzero(new)
+
+def select_vertices(bm, mask):
+    for v, sel in zip(bm.verts, mask.tolist()):
+        v.select = sel
+
+def move_verts_to_match(src_obj, tgt_obj, src_bm, tgt_bm, src_indices, tgt_indices):
+    src_verts = src_bm.verts
+    tgt_verts = tgt_bm.verts
+    n = min(len(src_indices), len(tgt_indices))
+    s_idx = np.asarray(src_indices[:n], dtype=np.int64)
+    t_idx = np.asarray(tgt_indices[:n], dtype=np.int64)
+    keep = (s_idx < len(src_verts)) & (t_idx < len(tgt_verts))
+    s_idx, t_idx = s_idx[keep].tolist(), t_idx[keep].tolist()
+    if not s_idx:
+        return
+
+    # Target local -> source local as one affine, applied to every pair at once
+    M = np.array(src_obj.matrix_world.inverted() @ tgt_obj.matrix_world)
+    tc = np.fromiter(chain.from_iterable(tgt_verts[t].co for t in t_idx),
+                     dtype=np.float64, count=len(t_idx) * 3).reshape(-1, 3)
+    new = tc @ M[:3, :3].T + M[:3, 3]
+
+    # BMesh has no foreach_set, so the scatter is a single assignment pass
+    for s, co in zip(s_idx, new.tolist()):
+        src_verts[s].co = co
 
 def ensure_both_selected(src_obj, tgt_obj):
     for obj in bpy.context.selected_objects:
@@ -88,6 +103,18 @@ def ensure_both_selected(src_obj, tgt_obj):
     tgt_obj.select_set(True)
     bpy.context.view_layer.objects.active = tgt_obj
 
+def ensure_edit_mode(src_obj, tgt_obj):
+    # Both meshes have to share one multi-object edit session
+    if src_obj.mode == 'EDIT' and tgt_obj.mode == 'EDIT':
+        return
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.mode_set(mode='EDIT')
+
+def edit_bmesh(obj):
+    bm = bmesh.from_edit_mesh(obj.data)
+    bm.verts.ensure_lookup_table()
+    return bm
+
 class GEO_OT_AddSource(Operator):
     bl_idname = "geo_match.add_source"
     bl_label = "Add Source Vertices"
@@ -123,7 +150,9 @@ class GEO_OT_AddTarget(Operator):
 class GEO_OT_CrawlTopology(Operator):
     bl_idname = "geo_match.visual_crawl"
     bl_label = "Crawl Topology"
-    bl_options = {'REGISTER', 'UNDO'}
+    # Repeated clicks collapse into a single undo step
+    bl_options = {'REGISTER', 'UNDO_GROUPED'}
+    bl_undo_group = "geo_match.visual_crawl"
 
     def execute(self, context):
         props = context.scene.geo_match_props
@@ -135,32 +164,43 @@ class GEO_OT_CrawlTopology(Operator):
             return {'CANCELLED'}
 
         ensure_both_selected(src_obj, tgt_obj)
+        ensure_edit_mode(src_obj, tgt_obj)
+
+        src_bm = edit_bmesh(src_obj)
+        tgt_bm = edit_bmesh(tgt_obj)
 
         initial_src = get_indices(props.source_start)
         initial_tgt = get_indices(props.target_start)
         if initial_src and initial_tgt:
-            move_verts_to_match(src_obj, tgt_obj, initial_src, initial_tgt)
+            move_verts_to_match(src_obj, tgt_obj, src_bm, tgt_bm, initial_src, initial_tgt)
 
-        src_visited = set(get_indices(props.visited_source))
-        tgt_visited = set(get_indices(props.visited_target))
+        src_visited = index_mask(len(src_bm.verts), get_indices(props.visited_source))
+        tgt_visited = index_mask(len(tgt_bm.verts), get_indices(props.visited_target))
 
-        new_tgt = crawl_one_ring(tgt_obj, tgt_visited)
-        new_src = crawl_one_ring(src_obj, src_visited)
+        # The last ring isn't stored between clicks, so expand from everything
+        # visited; the CSR gather keeps that a single vectorised pass
+        new_tgt = crawl_one_ring(build_adjacency(tgt_bm), np.flatnonzero(tgt_visited), tgt_visited)
+        new_src = crawl_one_ring(build_adjacency(src_bm), np.flatnonzero(src_visited), src_visited)
 
-        if not new_src or not new_tgt:
+        if not new_src.size or not new_tgt.size:
+            bmesh.update_edit_mesh(src_obj.data, destructive=False)
             self.report({'INFO'}, "No new vertices crawled.")
             return {'FINISHED'}
 
-        src_visited.update(new_src)
-        tgt_visited.update(new_tgt)
+        src_visited[new_src] = True
+        tgt_visited[new_tgt] = True
+
+        store_indices(props.visited_source, np.flatnonzero(src_visited).tolist())
+        store_indices(props.visited_target, np.flatnonzero(tgt_visited).tolist())
 
-        store_indices(props.visited_source, list(src_visited))
-        store_indices(props.visited_target, list(tgt_visited))
+        select_vertices(src_bm, index_mask(len(src_visited), new_src))
+        select_vertices(tgt_bm, index_mask(len(tgt_visited), new_tgt))
 
-        select_vertices(src_obj, new_src)
-        select_vertices(tgt_obj, new_tgt)
+        move_verts_to_match(src_obj, tgt_obj, src_bm, tgt_bm, new_src.tolist(), new_tgt.tolist())
 
-        move_verts_to_match(src_obj, tgt_obj, new_src, new_tgt)
+        # Source vertices moved, so keep its n-gon tessellation current
+        bmesh.update_edit_mesh(src_obj.data, destructive=False)
+        bmesh.update_edit_mesh(tgt_obj.data, loop_triangles=False, destructive=False)
 
         return {'FINISHED'}
 
@@ -180,33 +220,47 @@ class GEO_OT_MatchAll(Operator):
 
         ensure_both_selected(src_obj, tgt_obj)
 
-        src_visited = set(get_indices(props.source_start))
-        tgt_visited = set(get_indices(props.target_start))
+        src_seeds = get_indices(props.source_start)
+        tgt_seeds = get_indices(props.target_start)
 
-        if not src_visited or not tgt_visited:
+        if not src_seeds or not tgt_seeds:
             self.report({'ERROR'}, "Please define both source and target seeds.")
             return {'CANCELLED'}
 
-        move_verts_to_match(src_obj, tgt_obj, list(src_visited), list(tgt_visited))
+        ensure_edit_mode(src_obj, tgt_obj)
+        src_bm = edit_bmesh(src_obj)
+        tgt_bm = edit_bmesh(tgt_obj)
+
+        move_verts_to_match(src_obj, tgt_obj, src_bm, tgt_bm, src_seeds, tgt_seeds)
+
+        src_adj = build_adjacency(src_bm)
+        tgt_adj = build_adjacency(tgt_bm)
+        src_visited = index_mask(len(src_bm.verts), src_seeds)
+        tgt_visited = index_mask(len(tgt_bm.verts), tgt_seeds)
+        src_ring, tgt_ring = np.flatnonzero(src_visited), np.flatnonzero(tgt_visited)
 
         while True:
-            new_tgt = crawl_one_ring(tgt_obj, tgt_visited)
-            new_src = crawl_one_ring(src_obj, src_visited)
+            new_tgt = crawl_one_ring(tgt_adj, tgt_ring, tgt_visited)
+            new_src = crawl_one_ring(src_adj, src_ring, src_visited)
 
-            if not new_tgt or not new_src:
+            if not new_tgt.size or not new_src.size:
                 break
 
-            move_verts_to_match(src_obj, tgt_obj, new_src, new_tgt)
-            tgt_visited.update(new_tgt)
-            src_visited.update(new_src)
+            move_verts_to_match(src_obj, tgt_obj, src_bm, tgt_bm, new_src.tolist(), new_tgt.tolist())
+            tgt_visited[new_tgt] = True
+            src_visited[new_src] = True
+            src_ring, tgt_ring = new_src, new_tgt
+
+        store_indices(props.visited_source, np.flatnonzero(src_visited).tolist())
+        store_indices(props.visited_target, np.flatnonzero(tgt_visited).tolist())
 
-        store_indices(props.visited_source, list(src_visited))
-        store_indices(props.visited_target, list(tgt_visited))
+        select_vertices(src_bm, src_visited)
+        select_vertices(tgt_bm, tgt_visited)
 
-        select_vertices(src_obj, list(src_visited))
-        select_vertices(tgt_obj, list(tgt_visited))
+        bmesh.update_edit_mesh(src_obj.data, destructive=False)
+        bmesh.update_edit_mesh(tgt_obj.data, loop_triangles=False, destructive=False)
 
-        self.report({'INFO'}, f"Matched {min(len(src_visited), len(tgt_visited))} vertices.")
+        self.report({'INFO'}, f"Matched {min(int(src_visited.sum()), int(tgt_visited.sum()))} vertices.")
         return {'FINISHED'}
 
 class GEO_PT_GeoMatchPanel(Panel):